@@ -5,31 +5,110 @@ FastMCP Email Server with proper SSE support for OpenAI Responses API
 import os
 import sys
 import json
+import logging
 import re
 import asyncio
-from datetime import datetime
+import time
+import threading
+import sqlite3
+import hashlib
+import hmac
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from uuid import uuid4
+from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 import imaplib
 import smtplib
 import ssl
 import email
+from email import policy as email_policy
 from email.header import decode_header
+from email.parser import BytesHeaderParser, BytesParser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import orjson
+import tiktoken
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from sse_starlette.sse import EventSourceResponse
-from bs4 import BeautifulSoup
+from starlette.routing import Route
+import lxml.html
 
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Structured logging: per-message detail goes to DEBUG so production runs at
+# INFO don't pay a flushed write() per email
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Shared per-process constants: the SSL context parses the CA bundle once and
+# enables TLS session resumption on reconnects
+_SSL_CTX = ssl.create_default_context()
+_TZ_BERLIN = ZoneInfo("Europe/Berlin")
+_UID_RE = re.compile(rb"UID (\d+)")
+# Fallback HTML stripping when lxml rejects the markup
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+_DATE_HEADER_RE = re.compile(rb"^Date:[ \t]*(.+?)\r?$", re.M | re.I)
+
+# Shared parser instances - construction is cheap but not free, and the hot
+# loop creates neither state nor thread hazards by reusing them
+_HEADER_PARSER = BytesHeaderParser()
+_FULL_PARSER = BytesParser(policy=email_policy.default)
+
+# Configure OpenAI client. Bounded timeout and retries: the SDK default of
+# 10 minutes would pin a worker thread on a hung request far longer than any
+# caller waits for a summary.
+openai_client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=float(os.getenv("OPENAI_TIMEOUT", "30")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+)
+# Async twin of the client above, used for streaming completions straight off
+# the event loop without parking a worker thread per stream
+async_openai_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=float(os.getenv("OPENAI_TIMEOUT", "30")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5.1")
+
+# Token budget for the summarization prompt (input side)
+SUMMARY_INPUT_TOKEN_BUDGET = int(os.getenv("SUMMARY_INPUT_TOKEN_BUDGET", "8000"))
+
+# Token counting for prompt budgeting. tiktoken downloads the BPE data on
+# first use, so the encoder is built lazily: the server must still boot (and
+# budget by a chars/4 estimate) when that download fails.
+_token_encoder = None
+_token_encoder_failed = False
+
+
+def _count_tokens(text: str) -> int:
+    """Count prompt tokens, estimating at ~4 chars/token if tiktoken is unavailable."""
+    global _token_encoder, _token_encoder_failed
+    if _token_encoder is None and not _token_encoder_failed:
+        try:
+            try:
+                _token_encoder = tiktoken.encoding_for_model(OPENAI_MODEL)
+            except KeyError:
+                # Model not known to this tiktoken release yet
+                _token_encoder = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            _token_encoder_failed = True
+            logger.warning("tiktoken encoder unavailable (%s); estimating tokens by character count", e)
+    if _token_encoder is None:
+        return len(text) // 4 + 1
+    return len(_token_encoder.encode(text))
 
 # Email configuration
 IMAP_HOST = os.getenv("IMAP_HOST", "imap.strato.de")
@@ -42,241 +121,964 @@ EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "Frank Schulze")
 # Authentication configuration
 MCP_API_KEY = os.getenv("MCP_API_KEY")
 
+# IMAP tuning
+IMAP_FETCH_CHUNK = int(os.getenv("IMAP_FETCH_CHUNK", "100"))  # messages per FETCH command
+IMAP_PARSE_WORKERS = int(os.getenv("IMAP_PARSE_WORKERS", "8"))  # threads for message parsing
+# Skip messages above this size server-side (bytes, 0 disables). Payment
+# notifications are tens of KB; anything bigger is almost always attachments
+# we would download just to throw away.
+IMAP_MAX_SIZE = int(os.getenv("IMAP_MAX_SIZE", "524288"))
+
+# Summary cache: same emails -> same summary, skip the OpenAI call entirely
+SUMMARY_CACHE_DB = os.getenv("SUMMARY_CACHE_DB", "summary_cache.db")
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "86400"))  # seconds
+
+# Window cache: repeat summarize_emails calls for the same window skip even the
+# IMAP fetch. Windows entirely in the past get a long TTL since that slice of
+# the mailbox can no longer change.
+SUMMARY_WINDOW_TTL = int(os.getenv("SUMMARY_WINDOW_TTL", "300"))  # seconds
+SUMMARY_WINDOW_TTL_CLOSED = int(os.getenv("SUMMARY_WINDOW_TTL_CLOSED", "86400"))  # seconds
+_WINDOW_CACHE_MAX = 256
+
+_window_cache: Dict[tuple, tuple] = {}  # key -> (expires_at, result)
+_window_cache_lock = threading.Lock()
+
 if not IMAP_USER or not IMAP_PASS:
-    print("[ERROR] Missing IMAP_USER or IMAP_PASS in .env file", file=sys.stderr)
+    logger.error("Missing IMAP_USER or IMAP_PASS in .env file")
     sys.exit(1)
 
 if not os.getenv("OPENAI_API_KEY"):
-    print("[ERROR] Missing OPENAI_API_KEY in .env file", file=sys.stderr)
+    logger.error("Missing OPENAI_API_KEY in .env file")
     sys.exit(1)
 
 if MCP_API_KEY:
-    print("[INFO] MCP API Key authentication enabled", flush=True)
+    logger.info("MCP API Key authentication enabled")
 else:
-    print("[WARNING] MCP_API_KEY not set - authentication disabled", flush=True)
+    logger.warning("MCP_API_KEY not set - authentication disabled")
+
+# MCP tool schemas, built once at import time instead of per tools/list request
+_TOOLS_SCHEMA: List[Dict[str, Any]] = [
+    {
+        "name": "summarize_emails",
+        "description": "Fetch and summarize emails from a specified time range. Use this when the user asks about emails from a specific date or time period. Always provide ISO 8601 timestamps in UTC with Z suffix. Supports filtering by sender to reduce token usage.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "start_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "Start time in ISO 8601 format with Z suffix (e.g., '2024-06-05T00:00:00Z')"
+                },
+                "end_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "End time in ISO 8601 format with Z suffix (e.g., '2024-06-05T23:59:59Z')"
+                },
+                "sender_filter": {
+                    "type": "string",
+                    "description": "Optional: Filter emails by sender email address or domain (e.g., 'service.paypal.com', 'noreply@example.com')"
+                },
+                "max_emails": {
+                    "type": "integer",
+                    "description": "Maximum number of emails to process (default: 50, prevents token overflow)",
+                    "default": 50
+                },
+                "include_emails": {
+                    "type": "boolean",
+                    "description": "Include the full email list alongside the summary (default: false, keeps the response small)",
+                    "default": False
+                },
+                "stream": {
+                    "type": "boolean",
+                    "description": "Stream the summary token-by-token as SSE progress events (default: false)",
+                    "default": False
+                }
+            },
+            "required": ["start_iso", "end_iso"]
+        }
+    },
+    {
+        "name": "read_emails",
+        "description": "Fetch and return full email content from a specified time range without AI summarization. Use this when the user wants to see the complete emails. Always provide ISO 8601 timestamps in UTC with Z suffix. Supports filtering by sender to reduce token usage.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "start_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "Start time in ISO 8601 format with Z suffix (e.g., '2024-06-05T00:00:00Z')"
+                },
+                "end_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "End time in ISO 8601 format with Z suffix (e.g., '2024-06-05T23:59:59Z')"
+                },
+                "sender_filter": {
+                    "type": "string",
+                    "description": "Optional: Filter emails by sender email address or domain (e.g., 'service.paypal.com', 'noreply@example.com')"
+                },
+                "max_emails": {
+                    "type": "integer",
+                    "description": "Maximum number of emails to return (default: 50, prevents token overflow)",
+                    "default": 50
+                }
+            },
+            "required": ["start_iso", "end_iso"]
+        }
+    },
+    {
+        "name": "list_emails",
+        "description": "List email headers (sender, subject, date) from a specified time range without fetching bodies. Much faster and cheaper than read_emails; use this when the user only wants to know what arrived, not the content. Always provide ISO 8601 timestamps in UTC with Z suffix.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "start_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "Start time in ISO 8601 format with Z suffix (e.g., '2024-06-05T00:00:00Z')"
+                },
+                "end_iso": {
+                    "type": "string",
+                    "format": "date-time",
+                    "description": "End time in ISO 8601 format with Z suffix (e.g., '2024-06-05T23:59:59Z')"
+                },
+                "sender_filter": {
+                    "type": "string",
+                    "description": "Optional: Filter emails by sender email address or domain (e.g., 'service.paypal.com', 'noreply@example.com')"
+                },
+                "max_emails": {
+                    "type": "integer",
+                    "description": "Maximum number of emails to return (default: 50)",
+                    "default": 50
+                }
+            },
+            "required": ["start_iso", "end_iso"]
+        }
+    },
+    {
+        "name": "send_email",
+        "description": "Send an email to one or more recipients. Use this when the user wants to compose and send an email. Supports plain text or HTML content, CC and BCC recipients.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "to": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of recipient email addresses (e.g., ['user@example.com', 'another@example.com'])"
+                },
+                "subject": {
+                    "type": "string",
+                    "description": "Email subject line"
+                },
+                "body": {
+                    "type": "string",
+                    "description": "Email body content (plain text or HTML)"
+                },
+                "cc": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Optional list of CC recipients"
+                },
+                "bcc": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Optional list of BCC recipients"
+                },
+                "body_type": {
+                    "type": "string",
+                    "enum": ["plain", "html"],
+                    "description": "Email body type: 'plain' for plain text (default) or 'html' for HTML content",
+                    "default": "plain"
+                }
+            },
+            "required": ["to", "subject", "body"]
+        }
+    },
+    {
+        "name": "send_emails_bulk",
+        "description": "Send several emails in one call over a single SMTP session. Faster than repeated send_email calls when the user wants to send multiple messages. Each message takes the same fields as send_email.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "messages": {
+                    "type": "array",
+                    "description": "List of messages to send, in order",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "to": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "List of recipient email addresses"
+                            },
+                            "subject": {
+                                "type": "string",
+                                "description": "Email subject line"
+                            },
+                            "body": {
+                                "type": "string",
+                                "description": "Email body content (plain text or HTML)"
+                            },
+                            "cc": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Optional list of CC recipients"
+                            },
+                            "bcc": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Optional list of BCC recipients"
+                            },
+                            "body_type": {
+                                "type": "string",
+                                "enum": ["plain", "html"],
+                                "description": "Email body type (default: 'plain')",
+                                "default": "plain"
+                            }
+                        },
+                        "required": ["to", "subject", "body"]
+                    }
+                }
+            },
+            "required": ["messages"]
+        }
+    }
+]
 
-# Create FastAPI app
-app = FastAPI(title="Email Summarizer MCP Server", version="1.0.0")
+# The tools/list response only varies in the request id, so serialize the
+# envelope once and splice the id into the cached bytes per request
+_TOOLS_LIST_PREFIX = b'{"jsonrpc":"2.0","id":'
+_TOOLS_LIST_SUFFIX = b',"result":{"tools":' + orjson.dumps(_TOOLS_SCHEMA) + b'}}'
 
-# Add CORS middleware
+
+# Create FastAPI app (orjson serializes responses several times faster than
+# stdlib json). Swagger/ReDoc and the generated schema are disabled: this
+# server ships its own hand-written /openapi.json, and without openapi_url=None
+# the framework's generated route would shadow it.
+app = FastAPI(
+    title="Email Summarizer MCP Server",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None,
+)
+
+
+@app.exception_handler(Exception)
+async def _unhandled_exception(request: Request, exc: Exception):
+    """Minimal catch-all: log and return a flat 500 without traceback formatting."""
+    logger.error("Unhandled error on %s: %s", request.url.path, exc)
+    return ORJSONResponse(status_code=500, content={"error": "Internal server error"})
+
+# Add CORS middleware. Explicit origins keep preflight responses cacheable
+# (a wildcard with credentials forces the origin to be echoed per request)
+# and CORS on this API only matters for the ChatGPT plugin frontends anyway.
+ALLOWED_ORIGINS = [
+    o.strip() for o in os.getenv(
+        "ALLOWED_ORIGINS",
+        "https://chat.openai.com,https://platform.openai.com"
+    ).split(",") if o.strip()
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=600,
 )
 
+# Summaries and email lists are tens of KB of natural-language text, which
+# gzips 3-8x. Level 5 sits near the knee of the ratio/CPU curve; small
+# responses skip compression entirely.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
-def verify_api_key(request: Request) -> bool:
-    """Verify API key from Authorization header"""
-    if not MCP_API_KEY:
-        # If no API key is configured, allow all requests
-        return True
-    
-    auth_header = request.headers.get("Authorization", "")
-    
+
+# Compare as bytes: header values arrive as bytes on the wire, and
+# compare_digest raises TypeError on non-ASCII str input
+_MCP_API_KEY_BYTES = MCP_API_KEY.encode() if MCP_API_KEY else b""
+
+
+@lru_cache(maxsize=128)
+def _check_auth_header(auth_header: bytes) -> bool:
+    """Constant-time check of one Authorization header value.
+
+    Cached per header value: legitimate clients send the same value on every
+    request, so repeat checks are a dict hit. compare_digest keeps the
+    uncached path timing-safe against byte-by-byte probing.
+    """
     # Support both "Bearer <token>" and raw token
-    if auth_header.startswith("Bearer "):
-        token = auth_header[7:]
-    elif auth_header.startswith("bearer "):
+    if auth_header.startswith((b"Bearer ", b"bearer ")):
         token = auth_header[7:]
     else:
         token = auth_header
-    
-    return token == MCP_API_KEY
 
+    return hmac.compare_digest(token, _MCP_API_KEY_BYTES)
+
+
+# Pre-rendered 401 bodies: rejected requests (scanners, misconfigured
+# clients) should not pay for serialization
+_UNAUTH_BODY_JSONRPC = orjson.dumps({
+    "jsonrpc": "2.0",
+    "error": {
+        "code": -32001,
+        "message": "Unauthorized: Invalid or missing API key"
+    }
+})
+_UNAUTH_BODY_REST = orjson.dumps({"error": "Unauthorized: Invalid or missing API key"})
+
+
+class APIKeyASGIMiddleware:
+    """Pure-ASGI auth guard for /sse and /tool/* paths.
+
+    Rejects unauthorized requests before routing or body reads happen.
+    Deliberately not BaseHTTPMiddleware, which spawns a task group and
+    re-wraps the request per call. CORS preflights (OPTIONS) pass through
+    since browsers do not attach Authorization to them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and MCP_API_KEY and scope.get("method") != "OPTIONS":
+            path = scope.get("path", "")
+            if path == "/sse" or path.startswith("/tool/"):
+                auth_header = b""
+                for name, value in scope.get("headers", []):
+                    if name == b"authorization":
+                        auth_header = value
+                        break
+                if not _check_auth_header(auth_header):
+                    logger.warning("Auth failed: invalid or missing API key")
+                    body = _UNAUTH_BODY_JSONRPC if path == "/sse" else _UNAUTH_BODY_REST
+                    await send({
+                        "type": "http.response.start",
+                        "status": 401,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())
+                        ]
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(APIKeyASGIMiddleware)
+
+
+# IMAP connection pool: keep logged-in connections per (host, user) for the
+# process lifetime instead of paying TLS handshake + LOGIN on every request.
+# imaplib is not thread-safe (like smtplib, the protocol is strictly
+# sequential), so connections are checked OUT of the pool for exclusive use
+# and returned afterwards - a connection is never visible to two threads at
+# once. Concurrent fetches each get their own connection.
+_imap_pool: Dict[tuple, List[imaplib.IMAP4_SSL]] = {}
+_imap_pool_lock = threading.Lock()
+
+
+def _get_imap_connection() -> imaplib.IMAP4_SSL:
+    """Check a logged-in IMAP connection out of the pool, connecting if needed.
+
+    The caller owns the connection exclusively until it hands it back via
+    _release_imap_connection (healthy) or _discard_imap_connection (broken).
+    """
+    key = (IMAP_HOST, IMAP_USER)
+    while True:
+        with _imap_pool_lock:
+            idle = _imap_pool.get(key)
+            mail = idle.pop() if idle else None
+        if mail is None:
+            break
+        try:
+            if mail.noop()[0] == "OK":
+                return mail
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        logger.info("Pooled IMAP connection went stale, reconnecting")
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    logger.info("Connecting to IMAP server: %s:993", IMAP_HOST)
+    mail = imaplib.IMAP4_SSL(IMAP_HOST, 993, ssl_context=_SSL_CTX)
+
+    logger.info("Logging in as: %s", IMAP_USER)
+    status, response = mail.login(IMAP_USER, IMAP_PASS)
+    if status != "OK":
+        raise Exception(f"IMAP login failed: {response}")
+    logger.info("IMAP login successful")
+    return mail
+
+
+def _release_imap_connection(mail: imaplib.IMAP4_SSL) -> None:
+    """Return a healthy connection to the idle pool for the next caller."""
+    with _imap_pool_lock:
+        _imap_pool.setdefault((IMAP_HOST, IMAP_USER), []).append(mail)
+
+
+def _discard_imap_connection(mail: imaplib.IMAP4_SSL) -> None:
+    """Drop a broken connection instead of returning it to the pool."""
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+# SMTP connection kept open across send_email calls, mirroring the IMAP pool:
+# TLS handshake + LOGIN dominate the cost of sending a single small message.
+# Rotated after SMTP_MAX_PER_CONN messages - providers cap messages per
+# session, and a fresh session beats hitting that limit mid-send.
+SMTP_MAX_PER_CONN = int(os.getenv("SMTP_MAX_PER_CONN", "100"))
+_smtp_conn: Optional[smtplib.SMTP_SSL] = None
+_smtp_sent_count = 0
+_smtp_lock = threading.Lock()
+
+
+def _get_smtp_connection() -> smtplib.SMTP_SSL:
+    """Return the pooled, logged-in SMTP connection, reconnecting if stale.
+
+    Callers must hold _smtp_lock (the SMTP protocol is strictly sequential).
+    """
+    global _smtp_conn
+    if _smtp_conn is not None:
+        try:
+            if _smtp_conn.noop()[0] == 250:
+                return _smtp_conn
+        except (smtplib.SMTPException, OSError):
+            pass
+        logger.info("Pooled SMTP connection went stale, reconnecting")
+        _discard_smtp_connection()
+
+    logger.info("Connecting to SMTP server: %s:%s", SMTP_HOST, SMTP_PORT)
+    server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=_SSL_CTX)
+    server.login(IMAP_USER, IMAP_PASS)
+    _smtp_conn = server
+    return server
+
+
+def _discard_smtp_connection() -> None:
+    """Drop the pooled SMTP connection so the next send reconnects."""
+    global _smtp_conn, _smtp_sent_count
+    _smtp_sent_count = 0
+    if _smtp_conn is None:
+        return
+    try:
+        _smtp_conn.quit()
+    except Exception:
+        pass
+    _smtp_conn = None
+
+
+def _count_smtp_send() -> None:
+    """Track sends on the pooled connection, rotating it when it hits the cap.
+
+    Callers must hold _smtp_lock.
+    """
+    global _smtp_sent_count
+    _smtp_sent_count += 1
+    if SMTP_MAX_PER_CONN > 0 and _smtp_sent_count >= SMTP_MAX_PER_CONN:
+        logger.info("Rotating SMTP connection after %d messages", _smtp_sent_count)
+        _discard_smtp_connection()
+
+
+@lru_cache(maxsize=1024)
+def _decode_header_value(value: str) -> str:
+    """Decode an RFC 2047 header, with a fast path for the plain-ASCII majority.
+
+    Cached because notification traffic repeats the same handful of sender
+    and subject patterns over and over.
+    """
+    if not value:
+        return ""
+    if "=?" not in value:
+        # No encoded words - skip the decode_header state machine entirely
+        return value
+    return "".join(
+        part.decode(charset or "utf-8", errors="ignore") if isinstance(part, bytes) else part
+        for part, charset in decode_header(value)
+    )
+
+
+def _uid_sequence_set(uids: list) -> bytes:
+    """Collapse UIDs into a compact IMAP sequence set (1,2,3,7 -> b"1:3,7").
+
+    Ranges keep the FETCH command line short even for large chunks, avoiding
+    server-side maximum-request-size limits.
+    """
+    nums = sorted(int(u) for u in uids)
+    parts = []
+    run_start = run_end = nums[0]
+    for n in nums[1:]:
+        if n == run_end + 1:
+            run_end = n
+            continue
+        parts.append(f"{run_start}:{run_end}" if run_end > run_start else str(run_start))
+        run_start = run_end = n
+    parts.append(f"{run_start}:{run_end}" if run_end > run_start else str(run_start))
+    return ",".join(parts).encode()
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp.
 
-def fetch_emails_from_imap(start_iso: str, end_iso: str, sender_filter: Optional[str] = None, max_emails: int = 50) -> list:
+    Python 3.11+ handles the Z suffix natively; the replace() fallback keeps
+    older interpreters working. Cached: clients re-query the same window
+    bounds (and datetimes are immutable, so sharing the result is safe).
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+@lru_cache(maxsize=4096)
+def _parse_email_date(date_str: str) -> Optional[datetime]:
+    """Parse an RFC 2822 Date header, cached since notification traffic repeats.
+
+    The same Date strings come back on every overlapping query (and twice per
+    message: once for the early-stop probe, once for the real parse).
+    """
+    try:
+        parsed = email.utils.parsedate_to_datetime(date_str)
+    except Exception:
+        return None
+    if parsed is not None and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_TZ_BERLIN)
+    return parsed
+
+
+def _message_predates(raw_message: bytes, start_dt: datetime) -> bool:
+    """Cheap check whether a raw message's Date header falls before the window start."""
+    match = _DATE_HEADER_RE.search(raw_message[:4096])
+    if not match:
+        return False
+    msg_dt = _parse_email_date(match.group(1).decode("ascii", errors="ignore"))
+    return msg_dt is not None and msg_dt < start_dt
+
+
+def _decode_payload(part, max_bytes: Optional[int] = None) -> str:
+    """Decode one MIME part's payload using its declared charset.
+
+    Falls back to UTF-8 when the charset label is missing or unknown; decode
+    itself never raises since errors are ignored. max_bytes slices the raw
+    bytes before decoding, so oversized parts never pay for a full decode
+    when only a preview is kept.
+    """
+    payload = part.get_payload(decode=True) or b""
+    if max_bytes is not None:
+        payload = payload[:max_bytes]
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="ignore")
+    except LookupError:
+        return payload.decode("utf-8", errors="ignore")
+
+
+def _parse_raw_email(raw_message: bytes, start_dt: datetime, end_dt: datetime, include_body: bool = True) -> Optional[Dict[str, Any]]:
+    """Parse one raw RFC822 message into the email dict used downstream.
+
+    With include_body=False the literal only holds the requested header
+    fields, so the body extraction is skipped entirely.
+
+    Returns None when the message is outside the time range or unparseable.
+    """
+    date_str = ""
+    try:
+        # Parse only the header block first: out-of-range messages get rejected
+        # without materializing the full MIME tree (cheap for attachment-heavy mail)
+        header_end = raw_message.find(b"\r\n\r\n")
+        if header_end == -1:
+            header_end = raw_message.find(b"\n\n")
+        header_bytes = raw_message if header_end == -1 else raw_message[:header_end]
+        headers = _HEADER_PARSER.parsebytes(header_bytes)
+        date_str = headers.get("Date", "")
+
+        email_date = _parse_email_date(date_str)
+        if email_date is None or not (start_dt <= email_date <= end_dt):
+            return None
+
+        if not include_body:
+            return {
+                "from": _decode_header_value(headers.get("From", "")),
+                "subject": _decode_header_value(headers.get("Subject", "")),
+                "date": date_str,
+                "local_time": email_date.isoformat(),
+                "utc_timestamp": email_date.timestamp(),
+                "body_preview": ""
+            }
+
+        # In range - now pay for the full MIME parse
+        msg = _FULL_PARSER.parsebytes(raw_message)
+
+        # From/Subject were already parsed in the header block above; asking
+        # the full message again would re-run header folding and decoding
+        subject = _decode_header_value(headers.get("Subject", ""))
+        from_header = _decode_header_value(headers.get("From", ""))
+
+        # Extract FULL email body - PayPal details can be deep in the email
+        body_plain = ""
+        body_html_raw = ""
+        body_html_parsed = ""
+
+        # get_body walks the MIME tree with proper multipart/alternative
+        # precedence in C-level code; HTML is only touched when no plain
+        # text variant exists
+        # The preview keeps 10000 chars, so cap the decoded bytes: 40 KB of
+        # plain text covers the worst multi-byte case; HTML gets more slack
+        # because markup dilutes the text yield
+        part = msg.get_body(preferencelist=('plain',))
+        if part is not None:
+            body_plain = _decode_payload(part, max_bytes=40000)
+        if not body_plain:
+            part = msg.get_body(preferencelist=('html',))
+            if part is not None:
+                body_html_raw = _decode_payload(part, max_bytes=262144)
+
+        # Parse HTML to readable text if we have HTML
+        if body_html_raw:
+            try:
+                # lxml.html directly - BeautifulSoup only wrapped the same
+                # lxml parse and then re-walked the tree in Python
+                tree = lxml.html.fromstring(body_html_raw)
+                for element in tree.iter("script", "style"):
+                    element.drop_tree()
+
+                # Join text nodes with spaces before collapsing whitespace:
+                # text_content() concatenates them directly and glues adjacent
+                # block elements together ("...99,00 EURvon Hans...")
+                body_html_parsed = ' '.join(' '.join(tree.itertext()).split())
+
+                logger.debug("Parsed HTML: %d chars from %d HTML chars", len(body_html_parsed), len(body_html_raw))
+            except Exception as e:
+                logger.warning("HTML parsing failed: %s", e)
+                # Fallback to simple regex
+                body_html_parsed = _TAG_RE.sub(' ', body_html_raw)
+                body_html_parsed = _WS_RE.sub(' ', body_html_parsed).strip()
+
+        # Use the best available content, but limit to 10000 chars for API
+        body_preview = body_plain or body_html_parsed or ""
+        body_preview = body_preview[:10000]  # Increased from 3000 to 10000!
+
+        if not body_preview:
+            logger.debug("No body content extracted for email: %s", subject)
+
+        return {
+            "from": from_header,
+            "subject": subject,
+            "date": date_str,
+            "local_time": email_date.isoformat(),
+            "utc_timestamp": email_date.timestamp(),
+            "body_preview": body_preview
+        }
+
+    except Exception as e:
+        logger.warning("Error parsing email: %s", e)
+        return None
+
+
+def fetch_emails_from_imap(start_iso: str, end_iso: str, sender_filter: Optional[str] = None, max_emails: int = 50, include_body: bool = True) -> list:
     """Fetch emails from IMAP server within the specified time range.
-    
+
     Args:
         start_iso: Start time in ISO format
         end_iso: End time in ISO format
         sender_filter: Optional email address or domain to filter by (e.g., 'service.paypal.com')
         max_emails: Maximum number of emails to fetch (default: 50)
+        include_body: Fetch and parse full bodies; False transfers only the
+            From/Subject/Date headers (kilobytes instead of megabytes)
     """
     mail = None
     try:
-        start_dt = datetime.fromisoformat(start_iso.replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(end_iso.replace('Z', '+00:00'))
-        
-        print(f"[INFO] Connecting to IMAP server: {IMAP_HOST}:993", flush=True)
-        ssl_context = ssl.create_default_context()
-        mail = imaplib.IMAP4_SSL(IMAP_HOST, 993, ssl_context=ssl_context)
-        
-        # Login
-        print(f"[INFO] Logging in as: {IMAP_USER}", flush=True)
-        status, response = mail.login(IMAP_USER, IMAP_PASS)
-        if status != "OK":
-            raise Exception(f"IMAP login failed: {response}")
-        print(f"[INFO] IMAP login successful", flush=True)
+        start_dt = _parse_iso(start_iso)
+        end_dt = _parse_iso(end_iso)
         
+        mail = _get_imap_connection()
+
         # Select mailbox
-        print(f"[INFO] Selecting INBOX...", flush=True)
-        status, response = mail.select("INBOX")
+        logger.debug("Selecting INBOX...")
+        # Read-only: we never mutate flags, and EXAMINE spares the server the
+        # per-message \Seen bookkeeping a writable SELECT implies
+        status, response = mail.select("INBOX", readonly=True)
         if status != "OK":
             raise Exception(f"IMAP select INBOX failed: {response}")
-        print(f"[INFO] INBOX selected, {response[0].decode()} messages", flush=True)
+        logger.debug("INBOX selected, %s messages", response[0].decode())
         
         search_date = start_dt.strftime("%d-%b-%Y")
-        
-        # Build search criteria
+        # BEFORE is exclusive and day-granular, so upper-bound with end + 1 day
+        before_date = (end_dt + timedelta(days=1)).strftime("%d-%b-%Y")
+
+        # Build search criteria (server-side date+size window, fine-grained
+        # filter stays in Python)
+        criteria_parts = [f'SINCE "{search_date}"', f'BEFORE "{before_date}"']
         if sender_filter:
-            search_criteria = f'(SINCE "{search_date}" FROM "{sender_filter}")'
-        else:
-            search_criteria = f'(SINCE "{search_date}")'
-        
-        print(f"[INFO] Searching with criteria: {search_criteria}", flush=True)
-        status, messages = mail.search(None, search_criteria)
+            criteria_parts.append(f'FROM "{sender_filter}"')
+        if IMAP_MAX_SIZE > 0:
+            criteria_parts.append(f'SMALLER {IMAP_MAX_SIZE}')
+        search_criteria = f'({" ".join(criteria_parts)})'
         
+        # UIDVALIDITY scopes the per-UID cache: when it changes, cached UIDs are void
+        uidvalidity = 0
+        uv_data = mail.response('UIDVALIDITY')[1]
+        if uv_data and uv_data[0]:
+            uidvalidity = int(uv_data[0])
+
+        logger.info("Searching with criteria: %s", search_criteria)
+        status, messages = mail.uid('SEARCH', None, search_criteria)
+
         if status != "OK":
-            print(f"[ERROR] IMAP search failed: status={status}, messages={messages}", file=sys.stderr, flush=True)
+            logger.error("IMAP search failed: status=%s, messages=%s", status, messages)
             return []
-        
-        print(f"[INFO] Search successful, found {len(messages[0].split())} messages", flush=True)
-        
-        email_ids = messages[0].split()
-        emails = []
-        
+
+        logger.info("Search successful, found %d messages", len(messages[0].split()))
+
+        email_uids = messages[0].split()
+
         # Limit the number of emails to process
-        email_ids = email_ids[-max_emails:] if len(email_ids) > max_emails else email_ids
-        
-        for email_id in email_ids:
-            status, msg_data = mail.fetch(email_id, "(RFC822)")
+        email_uids = email_uids[-max_emails:] if len(email_uids) > max_emails else email_uids
+
+        # Serve already-parsed messages from the local cache; only new UIDs get fetched
+        start_ts = start_dt.timestamp()
+        end_ts = end_dt.timestamp()
+        cached = _email_cache_load(uidvalidity, [int(u) for u in email_uids])
+        if cached:
+            logger.info("Email cache hit for %d of %d messages", len(cached), len(email_uids))
+        emails = [e for e in cached.values() if start_ts <= e["utc_timestamp"] <= end_ts]
+        uncached_uids = [u for u in email_uids if int(u) not in cached]
+
+        # Fetch in batches: one FETCH command per chunk instead of one round-trip per
+        # message. Chunks are walked newest-first so we can stop early: the INBOX is
+        # roughly append-ordered, and once an entire chunk predates the window start
+        # the older chunks cannot match either.
+        # INTERNALDATE rides along in the meta bytes for free and is the same
+        # clock the server's SINCE/BEFORE filtered on, so it drives the
+        # sub-day window check and the early stop without touching the body
+        fetch_items = "(INTERNALDATE BODY.PEEK[])" if include_body else "(INTERNALDATE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])"
+        raw_messages = []
+        for i in range(len(uncached_uids), 0, -IMAP_FETCH_CHUNK):
+            chunk = uncached_uids[max(0, i - IMAP_FETCH_CHUNK):i]
+            status, msg_data = mail.uid('FETCH', _uid_sequence_set(chunk), fetch_items)
             if status != "OK":
+                logger.warning("IMAP batch fetch failed: status=%s", status)
                 continue
-            
-            msg = email.message_from_bytes(msg_data[0][1])
-            date_str = msg.get("Date", "")
-            
-            try:
-                email_date = email.utils.parsedate_to_datetime(date_str)
-                if email_date.tzinfo is None:
-                    email_date = email_date.replace(tzinfo=ZoneInfo("Europe/Berlin"))
-                
-                if not (start_dt <= email_date <= end_dt):
+            # msg_data interleaves (meta, literal) tuples with b')' closers
+            chunk_raws = []
+            for item in msg_data:
+                if isinstance(item, tuple) and item[1]:
+                    meta = item[0] or b""
+                    uid_match = _UID_RE.search(meta)
+                    uid = int(uid_match.group(1)) if uid_match else 0
+                    internal = imaplib.Internaldate2tuple(meta)
+                    internal_ts = time.mktime(internal) if internal else None
+                    chunk_raws.append((uid, internal_ts, item[1]))
+
+            for uid, internal_ts, raw in chunk_raws:
+                # Arrival time clearly outside the window: skip the MIME parse.
+                # The Date header is the authoritative filter (applied in
+                # _parse_raw_email), and delivery can lag it, so give the
+                # arrival-time check a day of slack on each side - it only
+                # exists to spare the parse on obvious misses.
+                if internal_ts is not None and not (start_ts - 86400 <= internal_ts <= end_ts + 86400):
                     continue
-                
-                subject = ""
-                if msg.get("Subject"):
-                    decoded = decode_header(msg["Subject"])[0]
-                    if isinstance(decoded[0], bytes):
-                        subject = decoded[0].decode(decoded[1] or "utf-8", errors="ignore")
-                    else:
-                        subject = decoded[0]
-                
-                from_header = msg.get("From", "")
-                
-                # Extract FULL email body - PayPal details can be deep in the email
-                body_plain = ""
-                body_html_raw = ""
-                body_html_parsed = ""
-                
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        
-                        # Get plain text version (FULL, not truncated)
-                        if content_type == "text/plain" and not body_plain:
-                            try:
-                                body_plain = part.get_payload(decode=True).decode("utf-8", errors="ignore")
-                            except:
-                                pass
-                        
-                        # Get HTML version (FULL, not truncated)
-                        elif content_type == "text/html" and not body_html_raw:
-                            try:
-                                body_html_raw = part.get_payload(decode=True).decode("utf-8", errors="ignore")
-                            except:
-                                pass
-                else:
-                    try:
-                        payload = msg.get_payload(decode=True).decode("utf-8", errors="ignore")
-                        if msg.get_content_type() == "text/plain":
-                            body_plain = payload
-                        else:
-                            body_html_raw = payload
-                    except:
-                        pass
-                
-                # Parse HTML to readable text if we have HTML
-                if body_html_raw:
-                    try:
-                        soup = BeautifulSoup(body_html_raw, 'lxml')
-                        
-                        # Remove script, style, and meta elements
-                        for element in soup(["script", "style", "meta", "link"]):
-                            element.decompose()
-                        
-                        # Get text and clean it up
-                        text = soup.get_text(separator=' ', strip=True)
-                        
-                        # Clean up whitespace
-                        lines = (line.strip() for line in text.splitlines())
-                        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                        body_html_parsed = ' '.join(chunk for chunk in chunks if chunk)
-                        
-                        print(f"[INFO] Parsed HTML: {len(body_html_parsed)} chars from {len(body_html_raw)} HTML chars", flush=True)
-                    except Exception as e:
-                        print(f"[WARNING] BeautifulSoup parsing failed: {e}", flush=True)
-                        # Fallback to simple regex
-                        body_html_parsed = re.sub(r'<[^>]+>', ' ', body_html_raw)
-                        body_html_parsed = re.sub(r'\s+', ' ', body_html_parsed).strip()
-                
-                # Use the best available content, but limit to 10000 chars for API
-                body_preview = body_plain or body_html_parsed or ""
-                body_preview = body_preview[:10000]  # Increased from 3000 to 10000!
-                
-                if not body_preview:
-                    print(f"[WARNING] No body content extracted for email: {subject}", flush=True)
-                
-                emails.append({
-                    "from": from_header,
-                    "subject": subject,
-                    "date": date_str,
-                    "local_time": email_date.isoformat(),
-                    "utc_timestamp": email_date.timestamp(),
-                    "body_preview": body_preview
-                })
-            
-            except Exception as e:
-                print(f"[WARNING] Error parsing email: {e}", file=sys.stderr)
-                continue
-        
-        print(f"[INFO] Closing IMAP connection", flush=True)
+                raw_messages.append((uid, raw))
+
+            if chunk_raws and all(
+                (ts < start_ts) if ts is not None else _message_predates(raw, start_dt)
+                for _, ts, raw in chunk_raws
+            ):
+                logger.info("Remaining messages predate the window, stopping fetch early")
+                break
+
+        # Parse messages in parallel - decoding and HTML parsing dominate CPU here
+        if raw_messages:
+            with ThreadPoolExecutor(max_workers=IMAP_PARSE_WORKERS) as executor:
+                parsed = list(executor.map(
+                    lambda pair: (pair[0], _parse_raw_email(pair[1], start_dt, end_dt, include_body)), raw_messages
+                ))
+            if include_body:
+                # Header-only results would poison the cache with empty bodies
+                _email_cache_store(uidvalidity, {uid: e for uid, e in parsed if uid and e is not None})
+            emails.extend(e for _, e in parsed if e is not None)
+
+        # Cache hits and fresh fetches arrive out of order, restore chronology
+        emails.sort(key=lambda e: e["utc_timestamp"])
+
+        # Unselect the mailbox but keep the authenticated connection pooled
         mail.close()
-        mail.logout()
+        _release_imap_connection(mail)
         return emails
-    
+
     except Exception as e:
-        print(f"[ERROR] IMAP error: {e}", file=sys.stderr, flush=True)
-        # Attempt to cleanup connection
+        logger.error("IMAP error: %s", e)
+        # Drop the (possibly broken) connection so the next call reconnects
         if mail:
-            try:
-                mail.logout()
-            except:
-                pass
+            _discard_imap_connection(mail)
         raise
 
 
-def generate_summary(emails: list) -> str:
-    """Generate AI summary of emails using OpenAI."""
-    if not emails:
-        return "No emails found in the specified time range."
-    
+# Background jobs for the REST endpoint: long summarizations can run off the
+# request path, with the client polling the status endpoint for the result.
+# Each entry is [future, done_ts]; done_ts is set when the job finishes so
+# results a client never collects can be expired instead of piling up.
+_job_pool = ThreadPoolExecutor(max_workers=int(os.getenv("JOB_POOL_WORKERS", "16")))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "600"))  # seconds to keep an uncollected result
+_jobs: Dict[str, list] = {}
+_jobs_lock = threading.Lock()
+
+
+def _submit_job(job_id: str, future: Future) -> None:
+    """Track a background job and stamp it when it completes."""
+    entry = [future, None]
+    future.add_done_callback(lambda f: entry.__setitem__(1, time.time()))
+    with _jobs_lock:
+        _sweep_jobs()
+        _jobs[job_id] = entry
+
+
+def _sweep_jobs() -> None:
+    """Drop finished jobs nobody collected within JOB_RESULT_TTL.
+
+    Callers must hold _jobs_lock. Collected results are popped immediately;
+    this only catches clients that submit a job and never poll it.
+    """
+    cutoff = time.time() - JOB_RESULT_TTL
+    for job_id, entry in list(_jobs.items()):
+        if entry[1] is not None and entry[1] < cutoff:
+            del _jobs[job_id]
+
+
+_summary_db: Optional[sqlite3.Connection] = None
+_summary_db_lock = threading.Lock()
+
+
+def _get_summary_db() -> sqlite3.Connection:
+    """Return the shared SQLite connection for the summary cache, creating it lazily."""
+    global _summary_db
+    if _summary_db is None:
+        db = sqlite3.connect(SUMMARY_CACHE_DB, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS cache(k TEXT PRIMARY KEY, v TEXT, ts INT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS email_cache("
+            "uidvalidity INTEGER, uid INTEGER, json TEXT, "
+            "PRIMARY KEY(uidvalidity, uid))"
+        )
+        db.commit()
+        _summary_db = db
+    return _summary_db
+
+
+def _summary_cache_key(emails: list) -> str:
+    """Stable content hash over (model, emails) for cache lookups."""
+    payload = json.dumps(emails, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256((OPENAI_MODEL + payload).encode("utf-8")).hexdigest()
+
+
+def _summary_cache_get(key: str) -> Optional[str]:
     try:
-        email_text = "\n\n---\n\n".join([
-            f"From: {e['from']}\nSubject: {e['subject']}\nDate: {e['date']}\n\n{e['body_preview']}"
-            for e in emails
-        ])
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-5.1",  # Using GPT-5.1 as requested
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are an expert data extraction specialist for emails, particularly payment notifications.
+        with _summary_db_lock:
+            row = _get_summary_db().execute("SELECT v, ts FROM cache WHERE k = ?", (key,)).fetchone()
+        if row and row[1] >= int(datetime.now().timestamp()) - SUMMARY_CACHE_TTL:
+            return row[0]
+    except sqlite3.Error as e:
+        logger.warning("Summary cache read failed: %s", e)
+    return None
+
+
+def _summary_cache_put(key: str, summary: str) -> None:
+    try:
+        with _summary_db_lock:
+            db = _get_summary_db()
+            db.execute(
+                "INSERT OR REPLACE INTO cache(k, v, ts) VALUES (?, ?, ?)",
+                (key, summary, int(datetime.now().timestamp()))
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        logger.warning("Summary cache write failed: %s", e)
+
+
+def _email_cache_load(uidvalidity: int, uids: list) -> Dict[int, Dict[str, Any]]:
+    """Load already-parsed emails for the given UIDs from the local cache."""
+    if not uidvalidity or not uids:
+        return {}
+    result: Dict[int, Dict[str, Any]] = {}
+    try:
+        with _summary_db_lock:
+            placeholders = ",".join("?" * len(uids))
+            rows = _get_summary_db().execute(
+                f"SELECT uid, json FROM email_cache WHERE uidvalidity = ? AND uid IN ({placeholders})",
+                [uidvalidity, *uids]
+            ).fetchall()
+        for uid, payload in rows:
+            try:
+                result[uid] = json.loads(payload)
+            except ValueError:
+                continue
+    except sqlite3.Error as e:
+        logger.warning("Email cache read failed: %s", e)
+    return result
+
+
+def _email_cache_store(uidvalidity: int, entries: Dict[int, Dict[str, Any]]) -> None:
+    """Persist freshly parsed emails; rows from older UIDVALIDITY generations are dropped."""
+    if not uidvalidity or not entries:
+        return
+    try:
+        with _summary_db_lock:
+            db = _get_summary_db()
+            db.execute("DELETE FROM email_cache WHERE uidvalidity != ?", (uidvalidity,))
+            db.executemany(
+                "INSERT OR REPLACE INTO email_cache(uidvalidity, uid, json) VALUES (?, ?, ?)",
+                [(uidvalidity, uid, json.dumps(e, ensure_ascii=False)) for uid, e in entries.items()]
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        logger.warning("Email cache write failed: %s", e)
+
+
+def _build_email_text(emails: list) -> str:
+    """Concatenate emails for the prompt, newest-first up to the token budget.
+
+    Emails that do not fit are folded into a single trailer line so the model
+    knows what was left out instead of the prompt growing without bound.
+    """
+    blocks = []
+    used_tokens = 0
+    omitted_senders = []
+
+    for e in reversed(emails):  # newest first
+        block = f"From: {e['from']}\nSubject: {e['subject']}\nDate: {e['date']}\n\n{e['body_preview']}"
+        block_tokens = _count_tokens(block)
+        if blocks and used_tokens + block_tokens > SUMMARY_INPUT_TOKEN_BUDGET:
+            omitted_senders.append(e['from'])
+            continue
+        blocks.append(block)
+        used_tokens += block_tokens
+
+    blocks.reverse()  # restore chronological order
+    email_text = "\n\n---\n\n".join(blocks)
+
+    if omitted_senders:
+        unique_senders = list(dict.fromkeys(omitted_senders))
+        sender_note = ", ".join(unique_senders[:5])
+        if len(unique_senders) > 5:
+            sender_note += ", ..."
+        email_text += f"\n\n---\n\n[+{len(omitted_senders)} older emails omitted to stay within the token budget; senders: {sender_note}]"
+        logger.info("Prompt budget: %d tokens used, %d emails folded", used_tokens, len(omitted_senders))
+
+    return email_text
+
+
+# How many emails go into one extraction prompt before the window is split
+# into parallel chunks and merged afterwards (map-reduce).
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "20"))
+
+_SUMMARY_SYSTEM_PROMPT = """You are an expert data extraction specialist for emails, particularly payment notifications.
 
 CRITICAL: You must extract EXACT information from the email body text provided. Do NOT say "N/A" unless the information is truly missing.
 
@@ -305,43 +1107,121 @@ For PayPal payment emails (subject: "Du hast eine Zahlung erhalten"):
 5. Extract DATE/TIME from the email
 
 Create a detailed table with ALL extracted information for EACH email. If you find the information in the body text, include it!"""
-                },
-                {
-                    "role": "user",
-                    "content": f"Extract detailed payment information from these {len(emails)} emails. Each email body contains up to 2000 characters with all details:\n\n{email_text}"
-                }
-            ],
-            temperature=0.1,  # Lower for more precise extraction
-            max_tokens=4000  # More tokens for detailed output
-        )
-        
-        return response.choices[0].message.content
-    
+
+
+def _extract_completion(user_content: str) -> str:
+    """Run one extraction prompt against OpenAI and return the text."""
+    response = openai_client.chat.completions.create(
+        model=OPENAI_MODEL,  # Using GPT-5.1 as requested
+        messages=[
+            {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.1,  # Lower for more precise extraction
+        max_tokens=4000  # More tokens for detailed output
+    )
+    return response.choices[0].message.content
+
+
+def _extract_chunk(emails: list) -> str:
+    """Extraction prompt over one chunk of emails."""
+    email_text = _build_email_text(emails)
+    return _extract_completion(
+        f"Extract detailed payment information from these {len(emails)} emails. "
+        f"Each email body contains up to 2000 characters with all details:\n\n{email_text}"
+    )
+
+
+def _map_reduce_summary(emails: list) -> str:
+    """Summarize a large window as parallel per-chunk extractions plus one merge.
+
+    A single prompt over many emails both overflows the token budget (older
+    emails get folded away by _build_email_text) and serializes one very long
+    completion. Chunking keeps every email in a prompt and overlaps the
+    OpenAI calls.
+    """
+    chunks = [emails[i:i + SUMMARY_CHUNK_SIZE] for i in range(0, len(emails), SUMMARY_CHUNK_SIZE)]
+    logger.info("Map-reduce summary: %d emails in %d chunks", len(emails), len(chunks))
+    with ThreadPoolExecutor(max_workers=min(4, len(chunks))) as pool:
+        partials = list(pool.map(_extract_chunk, chunks))
+    merged = "\n\n".join(f"Partial extraction {i + 1}:\n{p}" for i, p in enumerate(partials))
+    return _extract_completion(
+        "The following partial extractions each cover one chunk of the same mailbox "
+        "time range. Merge them into one detailed table covering every email, "
+        "without dropping or duplicating rows:\n\n" + merged
+    )
+
+
+def generate_summary(emails: list) -> str:
+    """Generate AI summary of emails using OpenAI."""
+    if not emails:
+        return "No emails found in the specified time range."
+
+    cache_key = _summary_cache_key(emails)
+    cached = _summary_cache_get(cache_key)
+    if cached is not None:
+        logger.info("Summary cache hit for %d emails", len(emails))
+        return cached
+
+    try:
+        if len(emails) > SUMMARY_CHUNK_SIZE:
+            summary = _map_reduce_summary(emails)
+        else:
+            summary = _extract_chunk(emails)
+        _summary_cache_put(cache_key, summary)
+        return summary
+
     except Exception as e:
-        print(f"[ERROR] OpenAI error: {e}", file=sys.stderr)
-        return f"Error generating summary: {e}"
+        # Propagate instead of returning error text: callers cache returned
+        # summaries, and a cached error would suppress retries for the TTL
+        logger.error("OpenAI error: %s", e)
+        raise
 
 
-def summarize_emails(start_iso: str, end_iso: str, sender_filter: Optional[str] = None, max_emails: int = 50) -> Dict[str, Any]:
+def summarize_emails(start_iso: str, end_iso: str, sender_filter: Optional[str] = None, max_emails: int = 50, include_emails: bool = False) -> Dict[str, Any]:
     """Main tool function for email summarization.
-    
+
     Args:
         start_iso: Start time in ISO format
         end_iso: End time in ISO format
         sender_filter: Optional email address or domain to filter by
         max_emails: Maximum number of emails to summarize (default: 50)
+        include_emails: Include the full email list in the response (default: False,
+            the summary already covers the content and the list bloats the payload)
     """
+    cache_key = (IMAP_USER, start_iso, end_iso, sender_filter, max_emails, include_emails)
+    now = datetime.now(ZoneInfo("UTC")).timestamp()
+    with _window_cache_lock:
+        hit = _window_cache.get(cache_key)
+        if hit is not None and hit[0] > now:
+            logger.info("Window cache hit for %s - %s", start_iso, end_iso)
+            return hit[1]
+
     try:
         emails = fetch_emails_from_imap(start_iso, end_iso, sender_filter, max_emails)
         summary = generate_summary(emails)
-        
-        return {
+
+        result = {
             "time_range": {"start": start_iso, "end": end_iso},
             "email_count": len(emails),
-            "emails": emails,
             "summary": summary,
             "note": f"Limited to {max_emails} most recent emails" if sender_filter else f"Limited to {max_emails} emails"
         }
+        if include_emails:
+            result["emails"] = emails
+
+        # Closed windows (ended over an hour ago) can't gain new mail, so they
+        # keep their result much longer than windows touching the present.
+        try:
+            end_ts = _parse_iso(end_iso).timestamp()
+            ttl = SUMMARY_WINDOW_TTL_CLOSED if end_ts < now - 3600 else SUMMARY_WINDOW_TTL
+        except ValueError:
+            ttl = SUMMARY_WINDOW_TTL
+        with _window_cache_lock:
+            if len(_window_cache) >= _WINDOW_CACHE_MAX:
+                _window_cache.pop(min(_window_cache, key=lambda k: _window_cache[k][0]))
+            _window_cache[cache_key] = (now + ttl, result)
+        return result
     except Exception as e:
         return {
             "error": str(e),
@@ -379,6 +1259,33 @@ def read_emails(start_iso: str, end_iso: str, sender_filter: Optional[str] = Non
         }
 
 
+def list_emails(start_iso: str, end_iso: str, sender_filter: Optional[str] = None, max_emails: int = 50) -> Dict[str, Any]:
+    """List email headers without fetching or decoding any bodies.
+
+    Args:
+        start_iso: Start time in ISO format
+        end_iso: End time in ISO format
+        sender_filter: Optional email address or domain to filter by
+        max_emails: Maximum number of emails to return (default: 50)
+    """
+    try:
+        emails = fetch_emails_from_imap(start_iso, end_iso, sender_filter, max_emails, include_body=False)
+
+        return {
+            "time_range": {"start": start_iso, "end": end_iso},
+            "email_count": len(emails),
+            "emails": emails,
+            "note": "Headers only; use read_emails for body content"
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "time_range": {"start": start_iso, "end": end_iso},
+            "email_count": 0,
+            "emails": []
+        }
+
+
 def send_email(
     to: List[str],
     subject: str,
@@ -421,13 +1328,21 @@ def send_email(
         if bcc:
             all_recipients.extend(bcc)
         
-        # Send via SMTP with SSL
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context) as server:
-            server.login(IMAP_USER, IMAP_PASS)
-            server.sendmail(IMAP_USER, all_recipients, msg.as_string())
+        # Send over the pooled SMTP connection; on a connection-level failure
+        # reconnect once and retry (the server may have idled us out)
+        with _smtp_lock:
+            try:
+                server = _get_smtp_connection()
+                # send_message serializes via BytesGenerator once, instead of
+                # as_string() rendering to str and sendmail re-encoding it
+                server.send_message(msg, from_addr=IMAP_USER, to_addrs=all_recipients)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                _discard_smtp_connection()
+                server = _get_smtp_connection()
+                server.send_message(msg, from_addr=IMAP_USER, to_addrs=all_recipients)
+            _count_smtp_send()
         
-        print(f"[EMAIL SENT] To: {to}, Subject: {subject}", flush=True)
+        logger.info("Email sent - to: %s, subject: %s", to, subject)
         
         return {
             "status": "success",
@@ -438,11 +1353,11 @@ def send_email(
                 "bcc": bcc or []
             },
             "subject": subject,
-            "sent_at": datetime.now(ZoneInfo("Europe/Berlin")).isoformat()
+            "sent_at": datetime.now(_TZ_BERLIN).isoformat()
         }
     
     except Exception as e:
-        print(f"[EMAIL ERROR] {e}", file=sys.stderr, flush=True)
+        logger.error("Email send failed: %s", e)
         return {
             "status": "error",
             "error": str(e),
@@ -450,6 +1365,166 @@ def send_email(
         }
 
 
+def send_emails_bulk(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Send several emails sequentially over the pooled SMTP session.
+
+    Each entry takes the same fields as send_email. The session is shared, so
+    the batch pays one TLS handshake + LOGIN instead of one per message (the
+    pool rotates it transparently if the batch exceeds the per-session cap).
+
+    Args:
+        messages: List of message dicts (to, subject, body, optional cc/bcc/body_type)
+
+    Returns:
+        Dictionary with per-message results and aggregate counts
+    """
+    results = []
+    sent = 0
+    for message in messages:
+        to = message.get("to", [])
+        if isinstance(to, str):
+            to = [to]
+        result = send_email(
+            to=to,
+            subject=message.get("subject", ""),
+            body=message.get("body", ""),
+            cc=message.get("cc"),
+            bcc=message.get("bcc"),
+            body_type=message.get("body_type", "plain")
+        )
+        results.append(result)
+        if result.get("status") == "success":
+            sent += 1
+
+    failed = len(messages) - sent
+    return {
+        "status": "success" if failed == 0 else ("partial" if sent else "error"),
+        "sent": sent,
+        "failed": failed,
+        "results": results
+    }
+
+
+# tools/call dispatch table: each adapter maps the JSON-RPC arguments dict
+# onto the tool function's signature, so the endpoint itself stays generic
+def _call_summarize_emails(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return summarize_emails(
+        arguments.get("start_iso"),
+        arguments.get("end_iso"),
+        arguments.get("sender_filter"),
+        arguments.get("max_emails", 50),
+        arguments.get("include_emails", False)
+    )
+
+
+def _call_read_emails(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return read_emails(
+        arguments.get("start_iso"),
+        arguments.get("end_iso"),
+        arguments.get("sender_filter"),
+        arguments.get("max_emails", 50)
+    )
+
+
+def _call_list_emails(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return list_emails(
+        arguments.get("start_iso"),
+        arguments.get("end_iso"),
+        arguments.get("sender_filter"),
+        arguments.get("max_emails", 50)
+    )
+
+
+def _call_send_email(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    to = arguments.get("to", [])
+    # Convert to list if it's a string
+    if isinstance(to, str):
+        to = [to]
+    return send_email(
+        to=to,
+        subject=arguments.get("subject", ""),
+        body=arguments.get("body", ""),
+        cc=arguments.get("cc"),
+        bcc=arguments.get("bcc"),
+        body_type=arguments.get("body_type", "plain")
+    )
+
+
+def _call_send_emails_bulk(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    return send_emails_bulk(arguments.get("messages", []))
+
+
+_TOOL_FUNCS = {
+    "summarize_emails": _call_summarize_emails,
+    "read_emails": _call_read_emails,
+    "list_emails": _call_list_emails,
+    "send_email": _call_send_email,
+    "send_emails_bulk": _call_send_emails_bulk,
+}
+
+
+async def _stream_summary_events(msg_id, start_iso, end_iso, sender_filter=None, max_emails=50):
+    """Async generator of SSE events for a streamed summarize_emails call.
+
+    Emits one notifications/progress event per token delta, then a final
+    JSON-RPC result carrying the assembled summary. The IMAP fetch still runs
+    in a thread; only the OpenAI stream is consumed natively async.
+    """
+    try:
+        emails = await asyncio.to_thread(
+            fetch_emails_from_imap, start_iso, end_iso, sender_filter, max_emails
+        )
+        parts = []
+        if emails:
+            stream = await async_openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Extract detailed payment information from these {len(emails)} emails. "
+                                   f"Each email body contains up to 2000 characters with all details:\n\n{_build_email_text(emails)}"
+                    }
+                ],
+                temperature=0.1,
+                max_tokens=4000,
+                stream=True
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield {
+                        "data": orjson.dumps({
+                            "jsonrpc": "2.0",
+                            "method": "notifications/progress",
+                            "params": {"text": delta}
+                        }).decode()
+                    }
+        summary = "".join(parts) if parts else "No emails found in the specified time range."
+        result = {
+            "time_range": {"start": start_iso, "end": end_iso},
+            "email_count": len(emails),
+            "summary": summary
+        }
+        yield {
+            "data": orjson.dumps({
+                "jsonrpc": "2.0",
+                "id": msg_id,
+                "result": {"content": [{"type": "text", "text": orjson.dumps(result).decode()}]}
+            }).decode()
+        }
+    except Exception as e:
+        logger.error("Streamed tools/call failed: %s", e)
+        yield {
+            "data": orjson.dumps({
+                "jsonrpc": "2.0",
+                "id": msg_id,
+                "error": {"code": -32603, "message": str(e)}
+            }).decode()
+        }
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -463,271 +1538,134 @@ async def root():
     }
 
 
-@app.get("/sse")
-@app.post("/sse")
-async def mcp_sse_endpoint(request: Request):
-    """MCP SSE endpoint for OpenAI Responses API"""
-    # Verify API key authentication
-    if not verify_api_key(request):
-        print("[AUTH FAILED] Invalid or missing API key", flush=True)
-        return JSONResponse(
-            status_code=401,
-            content={
-                "jsonrpc": "2.0",
-                "error": {
-                    "code": -32001,
-                    "message": "Unauthorized: Invalid or missing API key"
-                }
+# JSON-RPC method handlers for the MCP endpoint, keyed by method name so the
+# endpoint body is a single dict lookup instead of an if/elif chain
+async def _handle_initialize(msg_id, params: Dict[str, Any]):
+    response = {
+        "jsonrpc": "2.0",
+        "id": msg_id,
+        "result": {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {}
+            },
+            "serverInfo": {
+                "name": "email-summarizer",
+                "version": "1.0.0"
             }
+        }
+    }
+    return ORJSONResponse(content=response)
+
+
+async def _handle_tools_list(msg_id, params: Dict[str, Any]):
+    return Response(
+        content=_TOOLS_LIST_PREFIX + orjson.dumps(msg_id) + _TOOLS_LIST_SUFFIX,
+        media_type="application/json"
+    )
+
+
+async def _handle_tools_call(msg_id, params: Dict[str, Any]):
+    tool_name = params.get("name")
+    arguments = params.get("arguments", {})
+
+    # Opt-in token streaming: deliver the summary as SSE progress
+    # events instead of one buffered response
+    if tool_name == "summarize_emails" and arguments.get("stream"):
+        return EventSourceResponse(
+            _stream_summary_events(
+                msg_id,
+                arguments.get("start_iso"),
+                arguments.get("end_iso"),
+                arguments.get("sender_filter"),
+                arguments.get("max_emails", 50)
+            ),
+            # Defeat intermediary buffering (nginx et al.) so deltas
+            # actually reach the client as they are produced
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            # Keep-alive comments every 15s stop idle-timeout proxies
+            # from cutting the stream during a slow completion
+            ping=15
         )
-    
+
+    tool_func = _TOOL_FUNCS.get(tool_name)
+    if tool_func is None:
+        response = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "error": {
+                "code": -32601,
+                "message": f"Tool not found: {tool_name}"
+            }
+        }
+        return ORJSONResponse(content=response, status_code=404)
+
+    result = await asyncio.to_thread(tool_func, arguments)
+    # Compact text payload: the model consuming it does not need
+    # indentation, and pretty-printing large email lists is pure cost
+    response = {
+        "jsonrpc": "2.0",
+        "id": msg_id,
+        "result": {
+            "content": [
+                {
+                    "type": "text",
+                    "text": orjson.dumps(result).decode()
+                }
+            ]
+        }
+    }
+    return Response(content=orjson.dumps(response), media_type="application/json")
+
+
+_METHOD_HANDLERS = {
+    "initialize": _handle_initialize,
+    "tools/list": _handle_tools_list,
+    "tools/call": _handle_tools_call,
+}
+
+# 500 envelope as a bytes template: the error path should not itself spend
+# time building dicts and serializing a known-shape payload
+_ERR_TEMPLATE = b'{"jsonrpc":"2.0","id":1,"error":{"code":-32603,"message":"Internal error: %b"}}'
+
+
+async def mcp_sse_endpoint(request: Request):
+    """MCP SSE endpoint for OpenAI Responses API (auth handled in middleware)"""
+
     # Handle GET request (SSE connection info)
     if request.method == "GET":
-        return {
+        # Raw-route handlers must return a Response themselves
+        return ORJSONResponse(content={
             "protocol": "MCP over HTTP",
             "version": "2024-11-05",
             "server": "email-summarizer",
             "status": "ready",
             "note": "Send POST requests with JSON-RPC 2.0 format"
-        }
+        })
     
     # Handle POST request (MCP protocol)
     try:
-        body = await request.json()
+        # orjson decodes the raw bytes directly, skipping Starlette's stdlib json path
+        body = orjson.loads(await request.body())
         method = body.get("method")
         params = body.get("params", {})
         msg_id = body.get("id", 1)
         
         # Log the incoming request
-        print(f"[MCP REQUEST] method={method}, params={params}", flush=True)
-        
-        # Handle MCP protocol methods
-        if method == "initialize":
-            response = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {}
-                    },
-                    "serverInfo": {
-                        "name": "email-summarizer",
-                        "version": "1.0.0"
-                    }
-                }
-            }
-            return JSONResponse(content=response)
-        
-        elif method == "tools/list":
-            response = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "summarize_emails",
-                            "description": "Fetch and summarize emails from a specified time range. Use this when the user asks about emails from a specific date or time period. Always provide ISO 8601 timestamps in UTC with Z suffix. Supports filtering by sender to reduce token usage.",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "start_iso": {
-                                        "type": "string",
-                                        "format": "date-time",
-                                        "description": "Start time in ISO 8601 format with Z suffix (e.g., '2024-06-05T00:00:00Z')"
-                                    },
-                                    "end_iso": {
-                                        "type": "string",
-                                        "format": "date-time",
-                                        "description": "End time in ISO 8601 format with Z suffix (e.g., '2024-06-05T23:59:59Z')"
-                                    },
-                                    "sender_filter": {
-                                        "type": "string",
-                                        "description": "Optional: Filter emails by sender email address or domain (e.g., 'service.paypal.com', 'noreply@example.com')"
-                                    },
-                                    "max_emails": {
-                                        "type": "integer",
-                                        "description": "Maximum number of emails to process (default: 50, prevents token overflow)",
-                                        "default": 50
-                                    }
-                                },
-                                "required": ["start_iso", "end_iso"]
-                            }
-                        },
-                        {
-                            "name": "read_emails",
-                            "description": "Fetch and return full email content from a specified time range without AI summarization. Use this when the user wants to see the complete emails. Always provide ISO 8601 timestamps in UTC with Z suffix. Supports filtering by sender to reduce token usage.",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "start_iso": {
-                                        "type": "string",
-                                        "format": "date-time",
-                                        "description": "Start time in ISO 8601 format with Z suffix (e.g., '2024-06-05T00:00:00Z')"
-                                    },
-                                    "end_iso": {
-                                        "type": "string",
-                                        "format": "date-time",
-                                        "description": "End time in ISO 8601 format with Z suffix (e.g., '2024-06-05T23:59:59Z')"
-                                    },
-                                    "sender_filter": {
-                                        "type": "string",
-                                        "description": "Optional: Filter emails by sender email address or domain (e.g., 'service.paypal.com', 'noreply@example.com')"
-                                    },
-                                    "max_emails": {
-                                        "type": "integer",
-                                        "description": "Maximum number of emails to return (default: 50, prevents token overflow)",
-                                        "default": 50
-                                    }
-                                },
-                                "required": ["start_iso", "end_iso"]
-                            }
-                        },
-                        {
-                            "name": "send_email",
-                            "description": "Send an email to one or more recipients. Use this when the user wants to compose and send an email. Supports plain text or HTML content, CC and BCC recipients.",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "to": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "List of recipient email addresses (e.g., ['user@example.com', 'another@example.com'])"
-                                    },
-                                    "subject": {
-                                        "type": "string",
-                                        "description": "Email subject line"
-                                    },
-                                    "body": {
-                                        "type": "string",
-                                        "description": "Email body content (plain text or HTML)"
-                                    },
-                                    "cc": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "Optional list of CC recipients"
-                                    },
-                                    "bcc": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                        "description": "Optional list of BCC recipients"
-                                    },
-                                    "body_type": {
-                                        "type": "string",
-                                        "enum": ["plain", "html"],
-                                        "description": "Email body type: 'plain' for plain text (default) or 'html' for HTML content",
-                                        "default": "plain"
-                                    }
-                                },
-                                "required": ["to", "subject", "body"]
-                            }
-                        }
-                    ]
-                }
-            }
-            return JSONResponse(content=response)
-        
-        elif method == "tools/call":
-            tool_name = params.get("name")
-            arguments = params.get("arguments", {})
-            
-            if tool_name == "summarize_emails":
-                start_iso = arguments.get("start_iso")
-                end_iso = arguments.get("end_iso")
-                sender_filter = arguments.get("sender_filter")
-                max_emails = arguments.get("max_emails", 50)
-                
-                result = summarize_emails(start_iso, end_iso, sender_filter, max_emails)
-                
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": json.dumps(result, indent=2)
-                            }
-                        ]
-                    }
-                }
-                return JSONResponse(content=response)
-            
-            elif tool_name == "read_emails":
-                start_iso = arguments.get("start_iso")
-                end_iso = arguments.get("end_iso")
-                sender_filter = arguments.get("sender_filter")
-                max_emails = arguments.get("max_emails", 50)
-                
-                result = read_emails(start_iso, end_iso, sender_filter, max_emails)
-                
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": json.dumps(result, indent=2)
-                            }
-                        ]
-                    }
-                }
-                return JSONResponse(content=response)
-            
-            elif tool_name == "send_email":
-                to = arguments.get("to", [])
-                # Convert to list if it's a string
-                if isinstance(to, str):
-                    to = [to]
-                subject = arguments.get("subject", "")
-                body = arguments.get("body", "")
-                cc = arguments.get("cc")
-                bcc = arguments.get("bcc")
-                body_type = arguments.get("body_type", "plain")
-                
-                result = send_email(
-                    to=to,
-                    subject=subject,
-                    body=body,
-                    cc=cc,
-                    bcc=bcc,
-                    body_type=body_type
-                )
-                
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "result": {
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": json.dumps(result, indent=2)
-                            }
-                        ]
-                    }
-                }
-                return JSONResponse(content=response)
-            
-            else:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "error": {
-                        "code": -32601,
-                        "message": f"Tool not found: {tool_name}"
-                    }
-                }
-                return JSONResponse(content=response, status_code=404)
+        logger.debug("MCP request: method=%s, params=%s", method, params)
         
-        elif method.startswith("notifications/"):
+        # Handle MCP protocol methods via the dispatch table
+        handler = _METHOD_HANDLERS.get(method)
+        if handler is not None:
+            return await handler(msg_id, params)
+
+        if method and method.startswith("notifications/"):
             # Notifications don't require a response (JSON-RPC 2.0 spec)
             # Just acknowledge with 200 OK and empty response
-            print(f"[MCP NOTIFICATION] {method} - acknowledged", flush=True)
-            return JSONResponse(content={}, status_code=200)
-        
+            logger.debug("MCP notification %s - acknowledged", method)
+            return ORJSONResponse(content={}, status_code=200)
         else:
-            print(f"[MCP 404] Unknown method: {method}", flush=True)
+            logger.warning("Unknown MCP method: %s", method)
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
@@ -736,35 +1674,29 @@ async def mcp_sse_endpoint(request: Request):
                     "message": f"Method not found: {method}"
                 }
             }
-            return JSONResponse(content=response, status_code=404)
+            return ORJSONResponse(content=response, status_code=404)
     
     except Exception as e:
-        return JSONResponse(
-            content={
-                "jsonrpc": "2.0",
-                "id": 1,
-                "error": {
-                    "code": -32603,
-                    "message": f"Internal error: {str(e)}"
-                }
-            },
-            status_code=500
+        # orjson.dumps yields a quoted, JSON-escaped string; strip the quotes
+        # and splice it into the pre-built envelope
+        escaped = orjson.dumps(str(e))[1:-1]
+        return Response(
+            content=_ERR_TEMPLATE % escaped,
+            status_code=500,
+            media_type="application/json"
         )
 
 
-@app.get("/openapi.json")
-async def get_openapi_schema(request: Request):
-    """OpenAPI schema for compatibility"""
-    base_url = str(request.base_url).rstrip('/')
-    
-    return {
-        "openapi": "3.0.0",
+# The schema is static apart from the server URL; serialize it once and
+# splice the base URL into the pre-encoded bytes per request.
+_OPENAPI_SCHEMA = {
+    "openapi": "3.0.0",
         "info": {
             "title": "Email Summarizer API",
             "description": "MCP server for email summarization. Use /sse endpoint for MCP protocol.",
             "version": "1.0.0"
         },
-        "servers": [{"url": base_url}],
+        "servers": [{"url": "__BASE_URL__"}],
         "paths": {
             "/tool/summarize_emails": {
                 "post": {
@@ -800,62 +1732,219 @@ async def get_openapi_schema(request: Request):
             }
         }
     }
+_OPENAPI_BYTES = orjson.dumps(_OPENAPI_SCHEMA)
+
+
+@lru_cache(maxsize=8)
+def _render_openapi(base_url: str) -> bytes:
+    """Splice the base URL into the pre-encoded schema, cached per host.
+
+    A deployment sees one or two distinct base URLs, so after the first
+    request this is a dict lookup returning shared immutable bytes.
+    The URL comes from the client's Host header, so it goes through the
+    JSON encoder (quotes included) rather than being spliced raw.
+    """
+    return _OPENAPI_BYTES.replace(b'"__BASE_URL__"', orjson.dumps(base_url))
+
+
+async def get_openapi_schema(request: Request):
+    """OpenAPI schema for compatibility"""
+    # Compose the base URL straight from the scope: request.base_url builds
+    # and re-serializes a URL object per access, only for rstrip to copy it
+    host = b""
+    for name, value in request.scope["headers"]:
+        if name == b"host":
+            host = value
+            break
+    base_url = f"{request.scope['scheme']}://{host.decode('latin-1')}"
+    return Response(
+        content=_render_openapi(base_url),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"}
+    )
 
 
-@app.post("/tool/summarize_emails")
 async def summarize_emails_rest(request: Request):
-    """REST endpoint for testing"""
-    # Verify API key authentication
-    if not verify_api_key(request):
-        return JSONResponse(
-            status_code=401,
-            content={"error": "Unauthorized: Invalid or missing API key"}
-        )
-    
+    """REST endpoint for testing (auth handled in middleware)"""
     try:
-        data = await request.json()
+        # orjson decodes the raw bytes directly, like the MCP endpoint
+        try:
+            data = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            return ORJSONResponse(status_code=400, content={"error": "Invalid JSON body"})
         start_iso = data.get("start_iso")
         end_iso = data.get("end_iso")
         
         if not start_iso or not end_iso:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=400,
                 content={"error": "Missing start_iso or end_iso"}
             )
-        
-        result = summarize_emails(start_iso, end_iso)
-        return JSONResponse(content=result)
+
+        # Async mode: run the IMAP + OpenAI pipeline in the background and let the
+        # client poll the status endpoint instead of holding the request open
+        if data.get("async"):
+            job_id = uuid4().hex
+            _submit_job(job_id, _job_pool.submit(summarize_emails, start_iso, end_iso))
+            return ORJSONResponse(
+                status_code=202,
+                content={
+                    "job_id": job_id,
+                    "status": "pending",
+                    "status_url": f"/tool/summarize_emails/status/{job_id}"
+                }
+            )
+
+        # Off the event loop: the IMAP + OpenAI pipeline blocks for seconds
+        result = await asyncio.to_thread(summarize_emails, start_iso, end_iso)
+        # Pre-encoded bytes skip FastAPI's jsonable_encoder walk - the dict
+        # is already JSON-safe
+        return Response(content=orjson.dumps(result), media_type="application/json")
     
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"error": str(e)}
         )
 
 
+@app.get("/tool/summarize_emails/status/{job_id}")
+async def summarize_emails_status(job_id: str, request: Request):
+    """Poll the status of a background summarization job (auth handled in middleware)"""
+    with _jobs_lock:
+        _sweep_jobs()
+        entry = _jobs.get(job_id)
+
+    if entry is None:
+        return ORJSONResponse(status_code=404, content={"error": f"Unknown job: {job_id}"})
+
+    future = entry[0]
+    if not future.done():
+        return {"job_id": job_id, "status": "pending"}
+
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+    try:
+        result = future.result()
+    except Exception as e:
+        return ORJSONResponse(status_code=500, content={"job_id": job_id, "status": "error", "error": str(e)})
+
+    return {"job_id": job_id, "status": "done", "result": result}
+
+
+@app.post("/tool/summarize_emails/stream")
+async def summarize_emails_stream(request: Request):
+    """Stream the summary text token-by-token instead of buffering the whole
+    completion - the client sees first output after the IMAP fetch instead of
+    after the full OpenAI round trip. Auth is handled in middleware."""
+    try:
+        data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        return ORJSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+
+    start_iso = data.get("start_iso")
+    end_iso = data.get("end_iso")
+    if not start_iso or not end_iso:
+        return ORJSONResponse(status_code=400, content={"error": "Missing start_iso or end_iso"})
+
+    def generate():
+        try:
+            emails = fetch_emails_from_imap(
+                start_iso, end_iso,
+                data.get("sender_filter"),
+                int(data.get("max_emails", 50))
+            )
+            if not emails:
+                yield "No emails found in the specified time range."
+                return
+            stream = openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Extract detailed payment information from these {len(emails)} emails. "
+                                   f"Each email body contains up to 2000 characters with all details:\n\n{_build_email_text(emails)}"
+                    }
+                ],
+                temperature=0.1,
+                max_tokens=4000,
+                stream=True
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            # Headers are already sent at this point; the error has to go in-band
+            logger.error("Streaming summary failed: %s", e)
+            yield f"\n\n[Error: {e}]"
+
+    return StreamingResponse(generate(), media_type="text/plain; charset=utf-8")
+
+
+# The hot endpoints mount as plain Starlette routes, bypassing FastAPI's
+# APIRoute wrapper (signature inspection, dependency resolution, response
+# field processing). Their handlers already take a Request and return a
+# Response, so nothing else changes.
+app.router.routes.extend([
+    Route("/sse", mcp_sse_endpoint, methods=["GET", "POST"]),
+    Route("/openapi.json", get_openapi_schema, methods=["GET"]),
+    Route("/tool/summarize_emails", summarize_emails_rest, methods=["POST"]),
+])
+
+
 if __name__ == "__main__":
     import uvicorn
-    
-    print("🚀 FastMCP Email Server with MCP SSE Protocol")
-    print("=" * 60)
-    print("   Port: 5001")
-    print("   MCP SSE: http://0.0.0.0:5001/sse")
-    print("   OpenAPI: http://0.0.0.0:5001/openapi.json")
-    print("   REST Test: http://0.0.0.0:5001/tool/summarize_emails")
-    print("=" * 60)
-    print("")
-    if MCP_API_KEY:
-        print("🔒 Authentication: ENABLED")
-        print("   Use 'Authorization: Bearer <YOUR_API_KEY>' header")
-    else:
-        print("⚠️  Authentication: DISABLED (set MCP_API_KEY in .env)")
-    print("")
-    print("For OpenAI Responses API:")
-    print('  server_url: "https://frankimap.ngrok.dev/sse"')
-    print('  server_label: "email_summarizer"')
-    if MCP_API_KEY:
-        print('  auth_method: "Access Token/API key"')
-        print('  api_key: <YOUR_MCP_API_KEY>')
-    print("")
-    
-    uvicorn.run(app, host="0.0.0.0", port=5001)
+
+    host = os.getenv("MCP_HOST", "0.0.0.0")
+    port = int(os.getenv("MCP_PORT", "5001"))
+
+    # One write instead of ~20 print calls (each takes the stdout lock)
+    auth_banner = (
+        "🔒 Authentication: ENABLED\n"
+        "   Use 'Authorization: Bearer <YOUR_API_KEY>' header"
+        if MCP_API_KEY else
+        "⚠️  Authentication: DISABLED (set MCP_API_KEY in .env)"
+    )
+    api_key_banner = (
+        '\n  auth_method: "Access Token/API key"\n'
+        '  api_key: <YOUR_MCP_API_KEY>'
+        if MCP_API_KEY else ""
+    )
+    banner = (
+        f"🚀 FastMCP Email Server with MCP SSE Protocol\n"
+        f"{'=' * 60}\n"
+        f"   Port: {port}\n"
+        f"   MCP SSE: http://{host}:{port}/sse\n"
+        f"   OpenAPI: http://{host}:{port}/openapi.json\n"
+        f"   REST Test: http://{host}:{port}/tool/summarize_emails\n"
+        f"{'=' * 60}\n"
+        f"\n"
+        f"{auth_banner}\n"
+        f"\n"
+        f"For OpenAI Responses API:\n"
+        f'  server_url: "https://frankimap.ngrok.dev/sse"\n'
+        f'  server_label: "email_summarizer"{api_key_banner}\n'
+        f"\n"
+    )
+    sys.stdout.write(banner)
+    sys.stdout.flush()
+
+
+    # uvloop + httptools beat the asyncio/h11 defaults noticeably under load;
+    # uvicorn falls back to "auto" behavior only if we let it, so pin them.
+    # Multi-worker runs need the import string (workers fork fresh
+    # interpreters). Default stays 1 because background job tickets live in
+    # process memory - raise WEB_CONCURRENCY only if polling /status is not
+    # used or a shared store is put in front of it.
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        "mcp_sse_server:app",
+        host=host,
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )